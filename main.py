@@ -1,11 +1,28 @@
 import streamlit as st
+import io
 import random
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from fpdf import FPDF
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 import shutil
-from typing import List, Literal
+from typing import List, Literal, Protocol
+
+try:
+    import reportlab  # noqa: F401 — optional backend for large exams
+    _HAS_REPORTLAB = True
+except ImportError:
+    _HAS_REPORTLAB = False
+
+try:
+    from pypdf import PdfWriter  # optional — enables parallel chunked rendering
+    _HAS_PYPDF = True
+except ImportError:
+    _HAS_PYPDF = False
 
 # --- Constants & Configuration ---
 # Fallback URL if system font is missing
@@ -13,7 +30,17 @@ FONT_URL = "https://fonts.gstatic.com/s/roboto/v30/KFOmCnqEu92Fr1Mu4mxK.ttf"
 FONT_FILENAME = "font.ttf"
 SYSTEM_FONT_PATH = "C:/Windows/Fonts/arial.ttf"
 
-@dataclass
+# Shared HTTP session: retries transient failures (with backoff) instead of
+# forcing the user to reload the app after one flaky request.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(max_retries=Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET"],
+)))
+
+@dataclass(slots=True)
 class Question:
     id: int
     text: str
@@ -21,11 +48,35 @@ class Question:
     options: List[str] = None  # Only for MC
     correct_answer: str = None # Only for MC
 
+DURATION_OPTIONS = {
+    "15 phút (30 câu)": 30,
+    "60 phút (50 câu)": 50,
+    "90 phút (70 câu)": 70
+}
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Exam settings kept in session_state; question count is derived."""
+    grade: str
+    duration_label: str
+
+    @property
+    def count(self) -> int:
+        return DURATION_OPTIONS[self.duration_label]
+
 # --- Helper Functions ---
 
+# Flipped once the font file is known to exist; skips the stat() calls that
+# would otherwise run on every Streamlit rerun.
+_FONT_READY = False
+
 def download_font_if_missing():
     """Obtains a Unicode compatible font (checks System -> Download)."""
+    global _FONT_READY
+    if _FONT_READY:
+        return
     if os.path.exists(FONT_FILENAME):
+        _FONT_READY = True
         return
 
     # 1. Try Windows System Font
@@ -33,6 +84,7 @@ def download_font_if_missing():
         try:
             shutil.copy(SYSTEM_FONT_PATH, FONT_FILENAME)
             # st.toast(f"Đã sử dụng font hệ thống: {FONT_FILENAME}") # Optional feedback
+            _FONT_READY = True
             return
         except Exception as e:
             st.warning(f"Không thể copy font hệ thống: {e}")
@@ -42,147 +94,386 @@ def download_font_if_missing():
     with st.spinner(f"Đang tải font về máy chủ (lần đầu chạy)..."):
         try:
             headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-            response = requests.get(FONT_URL, headers=headers, timeout=15)
+            # Separate connect/read timeouts; retries handled by _SESSION
+            response = _SESSION.get(FONT_URL, headers=headers, stream=True, timeout=(3.05, 15))
             response.raise_for_status()
+            # Stream straight to disk instead of buffering the whole file
+            response.raw.decode_content = True
             with open(FONT_FILENAME, "wb") as f:
-                f.write(response.content)
+                shutil.copyfileobj(response.raw, f, length=64 * 1024)
+            # Sanity-check the sfnt magic so a truncated/corrupt download
+            # doesn't later blow up inside fpdf2's font parser
+            with open(FONT_FILENAME, "rb") as f:
+                magic = f.read(4)
+            if magic not in (b"\x00\x01\x00\x00", b"true", b"OTTO"):
+                os.remove(FONT_FILENAME)
+                raise ValueError("file tải về không phải font TTF hợp lệ")
+            _FONT_READY = True
             # st.success("Đã tải font thành công!")
         except Exception as e:
             st.warning(f"Không thể tải font (Lỗi: {e}). Ứng dụng sẽ dùng font mặc định (có thể lỗi hiển thị tiếng Việt). Cách khắc phục: Hãy upload file '{FONT_FILENAME}' lên GitHub.")
 
-def generate_mock_data(grade: str, total_questions: int, essay_percentage: float) -> List[Question]:
-    """Generates mock questions based on inputs."""
-    questions = []
-    
+# Mock data pools
+VOCAB = ["apple", "banana", "computer", "dog", "elephant", "flower", "garden", "house", "ice cream", "jungle"]
+GRAMMAR_Q = [
+    "She _____ to school every day.",
+    "They _____ playing football now.",
+    "_____ you like coffee?",
+    "I have _____ seen that movie.",
+    "He is the _____ student in class."
+]
+OPTIONS_POOL = [
+    ["go", "goes", "going", "gone"],
+    ["is", "am", "are", "be"],
+    ["Do", "Does", "Did", "Done"],
+    ["never", "ever", "fail", "not"],
+    ["good", "better", "best", "well"]
+]
+ESSAY_PROMPTS = [
+    "Write a short paragraph about your hobby.",
+    "Describe your best friend.",
+    "What did you do last summer?",
+    "Why is learning English important?",
+    "Describe your dream house."
+]
+
+def generate_mock_data(grade: str, total_questions: int, essay_percentage: float, seed: "int | None" = None) -> List[Question]:
+    """Generates mock questions based on inputs.
+
+    `seed` makes the template selection reproducible (same seed = same exam).
+    """
     num_essay = int(total_questions * (essay_percentage / 100))
     num_mc = total_questions - num_essay
-    
-    # Mock data pools
-    vocab = ["apple", "banana", "computer", "dog", "elephant", "flower", "garden", "house", "ice cream", "jungle"]
-    grammar_q = [
-        "She _____ to school every day.", 
-        "They _____ playing football now.", 
-        "_____ you like coffee?", 
-        "I have _____ seen that movie.",
-        "He is the _____ student in class."
-    ]
-    options_pool = [
-        ["go", "goes", "going", "gone"],
-        ["is", "am", "are", "be"],
-        ["Do", "Does", "Did", "Done"],
-        ["never", "ever", "fail", "not"],
-        ["good", "better", "best", "well"]
+
+    # Draw all template indices up front in two batched calls, then build
+    # each block in one comprehension
+    rng = random.Random(seed)
+    mc_idx = rng.choices(range(len(GRAMMAR_Q)), k=num_mc)
+    essay_idx = rng.choices(range(len(ESSAY_PROMPTS)), k=num_essay)
+
+    questions = [
+        Question(
+            id=i,
+            text=f"Question {i}: {GRAMMAR_Q[t]} ({grade} Level)",
+            q_type="MC",
+            options=OPTIONS_POOL[t],
+            correct_answer=OPTIONS_POOL[t][1], # Dummy logic
+        )
+        for i, t in enumerate(mc_idx, start=1)
     ]
-    
-    # Generate Multiple Choice
-    for i in range(num_mc):
-        q_idx = i % len(grammar_q)
-        q_text = f"Question {i+1}: {grammar_q[q_idx]} ({grade} Level)"
-        opts = options_pool[q_idx]
-        correct = opts[1] # Dummy logic
-        questions.append(Question(id=i+1, text=q_text, q_type="MC", options=opts, correct_answer=correct))
-
-    # Generate Essay
-    essay_prompts = [
-        "Write a short paragraph about your hobby.",
-        "Describe your best friend.",
-        "What did you do last summer?",
-        "Why is learning English important?",
-        "Describe your dream house."
+    questions += [
+        Question(
+            id=i,
+            text=f"Question {i}: {ESSAY_PROMPTS[t]} ({grade} Level)",
+            q_type="Essay",
+        )
+        for i, t in enumerate(essay_idx, start=num_mc + 1)
     ]
-    
-    for i in range(num_essay):
-        idx = num_mc + i + 1
-        prompt = essay_prompts[i % len(essay_prompts)]
-        q_text = f"Question {idx}: {prompt} ({grade} Level)"
-        questions.append(Question(id=idx, text=q_text, q_type="Essay"))
-        
+
     return questions
 
+# String-width cache shared across documents: widths only depend on the font
+# state, and the question/option strings repeat from a few templates.
+_STRING_WIDTH_CACHE = {}
+
 class PDF(FPDF):
+    _FOOTER = "TS. Nguyễn Trung Hòa - CEO AIGiaoDuc.vn - HotLine / Zalo: 0888186788"
+
+    # Which family the footer uses; _get_pdf overwrites this per instance once
+    # the Unicode font is registered, so footer() never has to probe/except.
+    footer_font = "Helvetica"
+
     def header(self):
         # We can add a header if needed, keeping it simple for now
         pass
 
     def footer(self):
         self.set_y(-15)
-        # Assuming 'TargetFont' is registered in create_pdf before this is called heavily OR we rely on standard font for footer if this fails?
-        # Actually footer() is called by add_page(). We must ensure font is added before add_page is called.
-        # In create_pdf, add_font is called before add_page, so 'TargetFont' should be available.
-        try:
-             self.set_font("TargetFont", size=8)
-        except:
-             # Fallback if somehow font not found in context (rare for fpdf2 if added globally)
-             self.set_font("Helvetica", size=8) 
-        
-        self.cell(0, 10, "TS. Nguyễn Trung Hòa - CEO AIGiaoDuc.vn - HotLine / Zalo: 0888186788", align="R")
+        self.set_font(self.footer_font, size=8)
+        self.cell(0, 10, self._FOOTER, align="R")
 
-def create_pdf(questions: List[Question], grade: str, duration_str: str, score_per_q: float) -> bytes:
+    def get_string_width(self, s, normalized=False, markdown=False):
+        # Memoize the per-character cmap walks; also hit by fpdf2 internals
+        if markdown:
+            return super().get_string_width(s, normalized, markdown)
+        key = (self.font_family, self.font_style, self.font_size_pt, normalized, s)
+        width = _STRING_WIDTH_CACHE.get(key)
+        if width is None:
+            width = super().get_string_width(s, normalized, markdown)
+            _STRING_WIDTH_CACHE[key] = width
+        return width
+
+# Resolved once per process: "TargetFont" if the TTF is usable, else "Helvetica".
+# fpdf2 registers fonts per document, so add_font itself stays in _get_pdf,
+# but the download/existence checks and the error path only run once.
+_RESOLVED_FONT = None
+
+# One-pass character sanitization for PDF text (en dash, curly apostrophe);
+# extend the mapping here rather than chaining .replace calls
+_SANITIZE_TABLE = str.maketrans({"–": "-", "’": "'"})
+
+# Wrapped-line cache. Question/option strings are built from a handful of
+# templates reused cyclically, so the greedy wrap (which walks glyph widths
+# via the TTF cmap) only needs to run once per distinct string.
+_WRAP_CACHE = {}
+
+def _wrap_lines(pdf: FPDF, text: str, max_width: float) -> "list[str]":
+    """Splits `text` into lines fitting `max_width`, caching per font/size."""
+    key = (text, pdf.font_family, pdf.font_size_pt, round(max_width, 2))
+    lines = _WRAP_CACHE.get(key)
+    if lines is not None:
+        return lines
+
+    lines = []
+    current = ""
+    for word in text.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if not current or pdf.get_string_width(candidate) <= max_width:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+    lines.append(current)
+
+    _WRAP_CACHE[key] = lines
+    return lines
+
+def _get_pdf() -> "tuple[PDF, str]":
+    """Creates a PDF document with the Unicode font already registered."""
+    global _RESOLVED_FONT
     pdf = PDF()
-    
-    font_family_name = "TargetFont"
 
-    # Register font
-    used_font = font_family_name
-    if not os.path.exists(FONT_FILENAME):
-        download_font_if_missing()
-    
-    if os.path.exists(FONT_FILENAME):
+    if _RESOLVED_FONT is None:
+        if not os.path.exists(FONT_FILENAME):
+            download_font_if_missing()
+        if os.path.exists(FONT_FILENAME):
+            _RESOLVED_FONT = "TargetFont"
+        else:
+            _RESOLVED_FONT = "Helvetica"
+            # st.warning("Không tìm thấy font tiếng Việt. Đang dùng font mặc định.")
+
+    if _RESOLVED_FONT == "TargetFont":
         try:
-            pdf.add_font(font_family_name, "", FONT_FILENAME)
+            pdf.add_font(_RESOLVED_FONT, "", FONT_FILENAME)
         except RuntimeError:
-            used_font = "Helvetica"
+            _RESOLVED_FONT = "Helvetica"
             st.error("Lỗi file font. Chuyển sang font mặc định.")
-    else:
-        used_font = "Helvetica"
-        # st.warning("Không tìm thấy font tiếng Việt. Đang dùng font mặc định.")
 
-    pdf.add_page()
-    pdf.set_font(used_font, size=16)
-    
-    # Title
-    pdf.cell(0, 10, f"ĐỀ THI TIẾNG ANH - {grade.upper()}", new_x="LMARGIN", new_y="NEXT", align="C")
-    pdf.set_font(used_font, size=12)
-    pdf.cell(0, 10, f"Thời gian: {duration_str} | Tổng điểm: 100", new_x="LMARGIN", new_y="NEXT", align="C")
-    pdf.ln(5)
-    
-    pdf.set_font(used_font, size=11)
-    
-    for q in questions:
-        point_text = f"{score_per_q:.2f} điểm"
-        
-        # Avoid orphan lines for question blocks
-        if pdf.get_y() > 250: 
+    pdf.footer_font = _RESOLVED_FONT
+    return pdf, _RESOLVED_FONT
+
+class PDFBackend(Protocol):
+    """What a PDF renderer must provide; create_pdf drives one of these."""
+
+    def draw_heading(self, grade: str, duration_str: str) -> None: ...
+    def draw_mc_question(self, q: Question, point_text: str) -> None: ...
+    def draw_essay_question(self, q: Question, point_text: str) -> None: ...
+    def finish(self) -> "bytes | bytearray": ...
+
+class FPDFBackend:
+    """Default backend: fpdf2 with the cached wrap/width machinery above."""
+
+    def __init__(self):
+        self.pdf, self.font = _get_pdf()
+        self.pdf.add_page()
+        # Let fpdf2 break pages natively; 25mm bottom margin leaves footer room
+        self.pdf.set_auto_page_break(auto=True, margin=25)
+        self.pdf.set_font(self.font, size=11)
+
+    def draw_heading(self, grade: str, duration_str: str) -> None:
+        pdf = self.pdf
+        pdf.set_font(self.font, size=16)
+        pdf.cell(0, 10, f"ĐỀ THI TIẾNG ANH - {grade.upper()}", new_x="LMARGIN", new_y="NEXT", align="C")
+        pdf.set_font(self.font, size=12)
+        pdf.cell(0, 10, f"Thời gian: {duration_str} | Tổng điểm: 100", new_x="LMARGIN", new_y="NEXT", align="C")
+        pdf.ln(5)
+        # Font set once; auto page breaks preserve the current font
+        pdf.set_font(self.font, size=11)
+
+    def _draw_question_text(self, q: Question, point_text: str) -> None:
+        # Wrap once per distinct string, then emit cheap cell() calls
+        pdf = self.pdf
+        qt_clean = q.text.translate(_SANITIZE_TABLE) # Basic sanitization if needed
+        text_width = pdf.w - pdf.l_margin - pdf.r_margin
+        for line in _wrap_lines(pdf, f"{qt_clean} ([{point_text}])", text_width):
+            pdf.cell(0, 6, line, new_x="LMARGIN", new_y="NEXT")
+
+    def draw_mc_question(self, q: Question, point_text: str) -> None:
+        pdf = self.pdf
+        self._draw_question_text(q, point_text)
+        # Display options like A. ... B. ...
+        opt_str = "      ".join(f"{label}. {opt}" for label, opt in zip("ABCD", q.options))
+        pdf.ln() # Ensure newline before options
+        # Options cycle through 5 pools, so the wrap cache hits every time
+        opt_width = pdf.w - 20 - pdf.r_margin
+        for line in _wrap_lines(pdf, opt_str, opt_width):
+            pdf.set_x(20) # Hardcoded 20mm indent (Margin 10 + 10)
+            pdf.cell(0, 6, line, new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(2)
+
+    def draw_essay_question(self, q: Question, point_text: str) -> None:
+        pdf = self.pdf
+        self._draw_question_text(q, point_text)
+        # ln()/line() bypass fpdf2's auto page break (only cell/multi_cell
+        # trigger it), so guard the writing block explicitly or the answer
+        # line can land through the footer band or off the page
+        if pdf.will_page_break(35):
             pdf.add_page()
-            
-        pdf.set_font(used_font, size=11) # Reset font style if changed
-        
-        # Question Text
-        # Using multi_cell for wrapping text
-        qt_clean = q.text.replace("\u2013", "-").replace("\u2019", "'") # Basic sanitization if needed
-        pdf.multi_cell(0, 6, f"{qt_clean} ([{point_text}])")
-        
+        pdf.ln(30) # Space for writing
+        pdf.line(pdf.get_x(), pdf.get_y(), 190, pdf.get_y()) # Writing line
+        pdf.ln(5)
+
+    def finish(self) -> bytearray:
+        return self.pdf.output()
+
+class ReportLabBackend:
+    """reportlab/platypus backend (optional extra, `pip install reportlab`).
+
+    reportlab's C-accelerated text metrics make it the better fit for very
+    large question sets; layout mirrors FPDFBackend closely but not byte-for-byte.
+    """
+
+    def __init__(self):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.lib.units import mm
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.platypus import SimpleDocTemplate
+
+        font_name = "Helvetica"
+        download_font_if_missing()
+        if os.path.exists(FONT_FILENAME):
+            try:
+                pdfmetrics.registerFont(TTFont("TargetFont", FONT_FILENAME))
+                font_name = "TargetFont"
+            except Exception:
+                pass
+
+        self._mm = mm
+        self._buf = io.BytesIO()
+        self._doc = SimpleDocTemplate(
+            self._buf, pagesize=A4,
+            leftMargin=10 * mm, rightMargin=10 * mm,
+            topMargin=10 * mm, bottomMargin=25 * mm,
+        )
+        self._font = font_name
+        self._story = []
+        self._question_style = ParagraphStyle("question", fontName=font_name, fontSize=11, leading=14)
+        self._options_style = ParagraphStyle("options", parent=self._question_style, leftIndent=10 * mm)
+
+    def draw_heading(self, grade: str, duration_str: str) -> None:
+        from reportlab.lib.enums import TA_CENTER
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.platypus import Paragraph, Spacer
+
+        title = ParagraphStyle("title", fontName=self._font, fontSize=16, leading=20, alignment=TA_CENTER)
+        subtitle = ParagraphStyle("subtitle", fontName=self._font, fontSize=12, leading=16, alignment=TA_CENTER)
+        self._story.append(Paragraph(f"ĐỀ THI TIẾNG ANH - {grade.upper()}", title))
+        self._story.append(Paragraph(f"Thời gian: {duration_str} | Tổng điểm: 100", subtitle))
+        self._story.append(Spacer(0, 5 * self._mm))
+
+    def _question_paragraph(self, q: Question, point_text: str):
+        from reportlab.platypus import Paragraph
+        qt_clean = q.text.translate(_SANITIZE_TABLE)
+        return Paragraph(f"{qt_clean} ([{point_text}])", self._question_style)
+
+    def draw_mc_question(self, q: Question, point_text: str) -> None:
+        from reportlab.platypus import Paragraph, Spacer
+        self._story.append(self._question_paragraph(q, point_text))
+        opt_str = "      ".join(f"{label}. {opt}" for label, opt in zip("ABCD", q.options))
+        self._story.append(Paragraph(opt_str, self._options_style))
+        self._story.append(Spacer(0, 2 * self._mm))
+
+    def draw_essay_question(self, q: Question, point_text: str) -> None:
+        from reportlab.platypus import HRFlowable, Spacer
+        self._story.append(self._question_paragraph(q, point_text))
+        self._story.append(Spacer(0, 30 * self._mm)) # Space for writing
+        self._story.append(HRFlowable(width="100%")) # Writing line
+        self._story.append(Spacer(0, 5 * self._mm))
+
+    def _draw_footer(self, canvas, doc) -> None:
+        canvas.saveState()
+        canvas.setFont(self._font, 8)
+        canvas.drawRightString(doc.pagesize[0] - 10 * self._mm, 10 * self._mm, PDF._FOOTER)
+        canvas.restoreState()
+
+    def finish(self) -> bytes:
+        self._doc.build(self._story, onFirstPage=self._draw_footer, onLaterPages=self._draw_footer)
+        return self._buf.getvalue()
+
+# Exams at least this large take a large-exam rendering strategy. Precedence
+# (first available wins): parallel fpdf2 chunks (pypdf extra, fork platforms
+# only), then the reportlab backend if installed, then serial fpdf2.
+_LARGE_EXAM_QUESTIONS = 200
+
+def _parallel_available() -> bool:
+    """Whether the chunked ProcessPoolExecutor path can run here.
+
+    Spawn-based workers (Windows/macOS) re-import the worker's module, but
+    Streamlit runs this script as __main__, so _render_chunk is only
+    reachable under the fork start method.
+    """
+    return _HAS_PYPDF and multiprocessing.get_start_method() == "fork"
+
+def _make_backend(num_questions: int) -> PDFBackend:
+    """Picks the serial renderer: reportlab for very large exams when
+    installed (and the parallel path didn't already claim them)."""
+    if _HAS_REPORTLAB and num_questions >= _LARGE_EXAM_QUESTIONS:
+        return ReportLabBackend()
+    return FPDFBackend()
+
+def _draw_questions(backend: PDFBackend, questions: List[Question], score_per_q: float) -> None:
+    # Constant per exam — format once, not per question
+    point_text = f"{score_per_q:.2f} điểm"
+    for q in questions:
         if q.q_type == "MC":
-            # Display options like A. ... B. ...
-            labels = ["A", "B", "C", "D"]
-            opt_str = ""
-            for idx, opt in enumerate(q.options):
-                opt_str += f"{labels[idx]}. {opt}      "
-            pdf.ln() # Ensure newline before options
-            current_y = pdf.get_y()
-            if current_y > 250: # Check page break for options too
-                 pdf.add_page()
-                 pdf.set_font(used_font, size=11)
-            
-            pdf.set_x(20) # Hardcoded 20mm indent (Margin 10 + 10)
-            pdf.multi_cell(0, 6, opt_str)
-            pdf.ln(2)
+            backend.draw_mc_question(q, point_text)
         elif q.q_type == "Essay":
-            pdf.ln(30) # Space for writing
-            pdf.line(pdf.get_x(), pdf.get_y(), 190, pdf.get_y()) # Writing line
-            pdf.ln(5)
-            
-    return bytes(pdf.output())
+            backend.draw_essay_question(q, point_text)
+
+def _render_chunk(args: tuple) -> bytes:
+    """Worker: renders one question chunk to a standalone fpdf2 PDF."""
+    questions, grade, duration_str, score_per_q, include_heading = args
+    backend = FPDFBackend()
+    if include_heading:
+        backend.draw_heading(grade, duration_str)
+    _draw_questions(backend, questions, score_per_q)
+    return bytes(backend.finish())
+
+def _create_pdf_parallel(questions: List[Question], grade: str, duration_str: str, score_per_q: float) -> bytes:
+    """Renders question chunks in worker processes and merges with pypdf.
+
+    The generation loop is pure Python, so splitting it across processes
+    sidesteps the GIL; font registration is paid once per worker.
+    """
+    download_font_if_missing() # fetch once in the parent; workers reuse the file
+    workers = min(4, os.cpu_count() or 1)
+    chunk_size = -(-len(questions) // workers) # ceil division
+    chunks = [questions[i:i + chunk_size] for i in range(0, len(questions), chunk_size)]
+    jobs = [(chunk, grade, duration_str, score_per_q, i == 0) for i, chunk in enumerate(chunks)]
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        parts = list(ex.map(_render_chunk, jobs))
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(io.BytesIO(part))
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+def create_pdf(questions: List[Question], grade: str, duration_str: str, score_per_q: float) -> bytes:
+    if len(questions) >= _LARGE_EXAM_QUESTIONS and _parallel_available():
+        return _create_pdf_parallel(questions, grade, duration_str, score_per_q)
+
+    backend = _make_backend(len(questions))
+    backend.draw_heading(grade, duration_str)
+    _draw_questions(backend, questions, score_per_q)
+    # st.download_button rejects bytearray, so fpdf2's output must be copied
+    # into bytes here; this is the one unavoidable serialized-PDF copy.
+    # (bytes() is a no-op for backends that already return bytes.)
+    return bytes(backend.finish())
 
 # --- Main App ---
 
@@ -198,13 +489,8 @@ def main():
     
     grade = st.sidebar.selectbox("Lớp", [f"Lớp {i}" for i in range(1, 11)])
     
-    duration_options = {
-        "15 phút (30 câu)": 30,
-        "60 phút (50 câu)": 50,
-        "90 phút (70 câu)": 70
-    }
-    duration_label = st.sidebar.selectbox("Thời gian & Số câu", list(duration_options.keys()))
-    num_questions = duration_options[duration_label]
+    duration_label = st.sidebar.selectbox("Thời gian & Số câu", list(DURATION_OPTIONS.keys()))
+    num_questions = DURATION_OPTIONS[duration_label]
     
     test_type = st.sidebar.radio("Loại đề thi", ["Trắc nghiệm", "Tự luận", "Kết hợp"])
     
@@ -221,44 +507,45 @@ def main():
         # Generate Data
         data = generate_mock_data(grade, num_questions, essay_percent)
         st.session_state['generated_data'] = data
-        st.session_state['config'] = {
-            'grade': grade,
-            'duration': duration_label,
-            'count': num_questions
-        }
+        st.session_state['config'] = Config(grade=grade, duration_label=duration_label)
+        # Render the PDF once per click; reruns (slider moves, preview scrolls)
+        # reuse the cached bytes instead of re-laying-out the whole document.
+        st.session_state['pdf_bytes'] = create_pdf(data, grade, duration_label, 100 / num_questions)
         st.success(f"Đã tạo đề thi {grade} với {num_questions} câu hỏi!")
 
     # --- Display Content ---
     if 'generated_data' in st.session_state:
         data = st.session_state['generated_data']
         config = st.session_state['config']
-        
-        score_per_q = 100 / config['count']
+
+        score_per_q = 100 / config.count
         
         st.divider()
         st.subheader("Xem trước đề thi")
         st.info(f"Mỗi câu hỏi: {score_per_q:.2f} điểm")
         
-        # Simple scrollable preview
+        # Simple scrollable preview — one markdown blob instead of 3-4
+        # frontend messages per question
+        preview_md = "\n\n---\n\n".join(
+            f"**{q.text}**\n\n" + (
+                f"A. {q.options[0]} | B. {q.options[1]} | C. {q.options[2]} | D. {q.options[3]}"
+                if q.q_type == "MC" else "_(Khoảng trống trả lời)_"
+            )
+            for q in data
+        )
         with st.container(height=500):
-            for q in data:
-                st.markdown(f"**{q.text}**")
-                if q.q_type == "MC":
-                    st.write(f"A. {q.options[0]} | B. {q.options[1]} | C. {q.options[2]} | D. {q.options[3]}")
-                else:
-                    st.caption("(Khoảng trống trả lời)")
-                st.divider()
+            st.markdown(preview_md)
                 
         # --- PDF Export ---
         st.subheader("Xuất file")
-        
-        pdf_bytes = create_pdf(data, config['grade'], config['duration'], score_per_q)
-        
+
+        pdf_bytes = st.session_state.get('pdf_bytes')
+
         if pdf_bytes:
             st.download_button(
                 label="📥 Xuất file PDF",
                 data=pdf_bytes,
-                file_name=f"De_Thi_{config['grade']}_{config['count']}cau.pdf",
+                file_name=f"De_Thi_{config.grade}_{config.count}cau.pdf",
                 mime="application/pdf"
             )
 